@@ -4,11 +4,42 @@
 处理1888-1962年的教育考试数据
 """
 
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # 只输出PNG文件，使用非交互式后端
 import matplotlib.pyplot as plt
 import json
+import hashlib
 import re
 import os
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow as pa  # 用于Parquet缓存
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import orjson  # 用于快速写出JSON
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import xxhash  # 用于快速计算输入文件哈希
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+try:
+    from numba import njit  # 用于分组求和内核
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 # 配色方案 - 暖色系
 COLORS = {
@@ -24,6 +55,14 @@ plt.rcParams['font.family'] = 'sans-serif'
 plt.rcParams['font.size'] = 10
 plt.rcParams['axes.facecolor'] = COLORS['background']
 plt.rcParams['figure.facecolor'] = COLORS['background']
+plt.rcParams['figure.dpi'] = 100
+plt.rcParams['savefig.dpi'] = 100
+
+# 引文匹配：以句号分句（贪婪匹配，线性扫描无回溯），再检查是否同时包含关键词
+# 直接在原始UTF-8字节上匹配：句号和关键词都是ASCII字节，不会出现在多字节字符内部。
+# 以二进制读取不会转换换行符，因此匹配到的句子需先把\r\n和\r统一为\n，
+# 结果才与以文本模式读取整个文件再匹配相同
+SENTENCE_PATTERN = re.compile(rb'[^.]+')
 
 # 获取当前脚本所在目录
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -32,35 +71,135 @@ DATA_DIR = os.path.join(SCRIPT_DIR, 'data')
 # 输出文件夹路径
 OUTPUT_DIR = SCRIPT_DIR
 
+# 输入文件（包括本脚本）与输出文件，用于判断是否需要重新生成
+INPUT_FILES = [
+    os.path.join(DATA_DIR, 'doc_timeline.csv'),
+    os.path.join(DATA_DIR, 'educationcomms.txt'),
+    os.path.join(DATA_DIR, 'merged_textinfo_by_subject_and_year.csv'),
+    os.path.abspath(__file__),
+]
+OUTPUT_FILES = [
+    os.path.join(OUTPUT_DIR, name) for name in (
+        'timeline_chart.png',
+        'language_subjects_chart.png',
+        'language_trends_chart.png',
+        'statistics.json',
+        'quotes.json',
+    )
+]
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, 'manifest.json')
+
+def _read_cached(path, columns=None, dtype=None):
+    """读取CSV（只读取columns指定的列），并在旁边缓存一份Parquet副本以加速后续运行"""
+    cache_path = path + '.parquet'
+    if not HAS_PYARROW:
+        return pd.read_csv(path, usecols=columns, dtype=dtype, engine='c')
+    
+    # 缓存以CSV内容哈希和所选列为键，保存在Parquet元数据中
+    source_hash = _hash_file(path)
+    cache_key = f"{source_hash}:{','.join(columns or [])}".encode()
+    try:
+        cached_key = (pq.read_schema(cache_path).metadata or {}).get(b'source_key')
+    except (OSError, ValueError):
+        cached_key = None
+    
+    # CSV内容变化（或文件不存在）时重新读取并生成缓存
+    if source_hash is None or cached_key != cache_key:
+        df = pd.read_csv(path, usecols=columns, dtype=dtype, engine='pyarrow')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), b'source_key': cache_key})
+        try:
+            pq.write_table(table, cache_path)
+        except OSError:
+            # 数据目录只读时不缓存，直接使用刚读取的数据
+            pass
+        return df
+    
+    df = pd.read_parquet(cache_path, engine='pyarrow', columns=columns, memory_map=True)
+    # 旧版本生成的缓存可能使用推断出的类型
+    return df.astype(dtype) if dtype is not None else df
+
+def _write_json(path, obj):
+    """以2空格缩进写出JSON文件"""
+    if HAS_ORJSON:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2)
+
+def _hash_file(path):
+    """计算文件内容的哈希值，文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    hasher = xxhash.xxh3_64() if HAS_XXHASH else hashlib.blake2b(digest_size=8)
+    # 空文件无法映射
+    if os.path.getsize(path) > 0:
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            hasher.update(mm)
+    return hasher.hexdigest()
+
+def _build_manifest():
+    """记录各输入文件的哈希值和输出文件列表"""
+    return {
+        'inputs': {os.path.relpath(path, SCRIPT_DIR): _hash_file(path) for path in INPUT_FILES},
+        'outputs': [os.path.relpath(path, OUTPUT_DIR) for path in OUTPUT_FILES],
+    }
+
+def _outputs_up_to_date(manifest):
+    """输入与上次运行相同且所有输出文件都存在时返回True"""
+    try:
+        with open(MANIFEST_PATH, 'r') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return previous == manifest and all(os.path.exists(path) for path in OUTPUT_FILES)
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _gb_sum(codes, vals, n):
+        """按整数编码分组求和（以int64累加，与pandas分组求和一致）"""
+        out = np.zeros(n, np.int64)
+        for i in range(codes.size):
+            out[codes[i]] += vals[i]
+        return out
+else:
+    def _gb_sum(codes, vals, n):
+        """按整数编码分组求和（以int64累加，与pandas分组求和一致）"""
+        out = np.zeros(n, np.int64)
+        np.add.at(out, codes, vals)
+        return out
+
 def load_data():
     """加载所有数据文件"""
     print("Loading data files...")
     print(f"Data directory: {DATA_DIR}")
     
     # 读取文档时间线
-    doc_timeline = pd.read_csv(os.path.join(DATA_DIR, 'doc_timeline.csv'))
-    
-    # 读取科目名称
-    subject_names = pd.read_csv(os.path.join(DATA_DIR, 'subject_names.csv'))
+    doc_timeline = _read_cached(os.path.join(DATA_DIR, 'doc_timeline.csv'),
+                                columns=['Year', 'Document Count'],
+                                dtype={'Year': 'int16', 'Document Count': 'int32'})
     
     # 读取合并后的科目年份数据
-    merged_data = pd.read_csv(os.path.join(DATA_DIR, 'merged_textinfo_by_subject_and_year.csv'))
+    merged_data = _read_cached(os.path.join(DATA_DIR, 'merged_textinfo_by_subject_and_year.csv'),
+                               columns=['Subject', 'Year', 'Document Count'],
+                               # 科目只有十余种取值，读为分类类型以便按整数编码筛选
+                               dtype={'Subject': 'category', 'Year': 'int16',
+                                      'Document Count': 'int32'})
     
     print("Data loaded successfully!")
-    return doc_timeline, subject_names, merged_data
+    return doc_timeline, merged_data
 
-def create_timeline_chart(doc_timeline):
+def create_timeline_chart(years, counts, ax):
     """创建文档数量时间线图表"""
     print("Creating timeline chart...")
     
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
     # 绘制折线图
-    ax.plot(doc_timeline['Year'], doc_timeline['Document Count'], 
-            color=COLORS['secondary'], linewidth=2)
+    ax.plot(years, counts, color=COLORS['secondary'], linewidth=2)
     
     # 标注战争期间（1939-1945）
-    war_years = doc_timeline[(doc_timeline['Year'] >= 1939) & (doc_timeline['Year'] <= 1945)]
     ax.axvspan(1939, 1945, alpha=0.2, color=COLORS['primary'], label='War Years (1939-1945)')
     
     # 标注1944-1945无记录
@@ -81,15 +220,14 @@ def create_timeline_chart(doc_timeline):
     for spine in ax.spines.values():
         spine.set_color(COLORS['border'])
     
-    plt.tight_layout()
+    fig = ax.figure
+    fig.tight_layout()
     output_path = os.path.join(OUTPUT_DIR, 'timeline_chart.png')
-    plt.savefig(output_path, dpi=150, bbox_inches='tight', 
-                facecolor=COLORS['background'])
-    plt.close()
+    fig.savefig(output_path)
     
     print(f"Timeline chart saved to: {output_path}")
 
-def create_language_subjects_chart(merged_data):
+def create_language_subjects_chart(merged_data, ax):
     """创建语言科目对比柱状图"""
     print("Creating language subjects chart...")
     
@@ -98,20 +236,29 @@ def create_language_subjects_chart(merged_data):
                          'GAELIC', 'GAELIC (LEARNERS)', 'GAELIC (NATIVE SPEAKERS)', 'SPANISH']
     
     # 筛选语言科目数据
-    lang_data = merged_data[merged_data['Subject'].isin(language_subjects)]
-    
-    # 按科目汇总文档数量
-    subject_counts = lang_data.groupby('Subject')['Document Count'].sum().sort_values(ascending=False)
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
+    subjects = merged_data['Subject'].cat
+    wanted_codes = subjects.categories.get_indexer(language_subjects)
+    wanted_codes = wanted_codes[wanted_codes >= 0]
+    codes = subjects.codes.to_numpy()
+    mask = np.isin(codes, wanted_codes)
+    lang_codes = codes[mask]
+    
+    # 按科目汇总文档数量（按整数编码分组）
+    totals = _gb_sum(lang_codes, merged_data['Document Count'].to_numpy()[mask],
+                     len(subjects.categories))
+    present = np.unique(lang_codes)
+    subject_counts = pd.Series(totals[present],
+                               index=subjects.categories[present].rename('Subject'),
+                               name='Document Count').sort_values(ascending=False)
     
     # 创建柱状图
     bars = ax.bar(range(len(subject_counts)), subject_counts.values, 
                    color=COLORS['secondary'], edgecolor=COLORS['primary'], linewidth=1.5)
     
     # 高亮显示英语和盖尔语
-    english_idx = list(subject_counts.index).index('ENGLISH') if 'ENGLISH' in subject_counts.index else None
-    gaelic_indices = [i for i, subj in enumerate(subject_counts.index) if 'GAELIC' in subj]
+    subject_index = subject_counts.index
+    english_idx = subject_index.get_loc('ENGLISH') if 'ENGLISH' in subject_index else None
+    gaelic_indices = np.flatnonzero(subject_index.str.contains('GAELIC', regex=False))
     
     if english_idx is not None:
         bars[english_idx].set_color(COLORS['primary'])
@@ -132,29 +279,33 @@ def create_language_subjects_chart(merged_data):
     for spine in ax.spines.values():
         spine.set_color(COLORS['border'])
     
-    plt.tight_layout()
+    fig = ax.figure
+    fig.tight_layout()
     output_path = os.path.join(OUTPUT_DIR, 'language_subjects_chart.png')
-    plt.savefig(output_path, dpi=150, bbox_inches='tight',
-                facecolor=COLORS['background'])
-    plt.close()
+    fig.savefig(output_path)
     
     print(f"Language subjects chart saved to: {output_path}")
     
     return subject_counts
 
-def create_language_trends_chart(merged_data):
+def create_language_trends_chart(merged_data, ax):
     """创建语言科目随时间变化的趋势图"""
     print("Creating language trends chart...")
     
     # 主要语言科目
     main_languages = ['ENGLISH', 'FRENCH', 'LATIN', 'GERMAN', 'GAELIC']
     
-    fig, ax = plt.subplots(figsize=(12, 6))
+    # 一次筛选、排序并分组，循环中只需按科目查找
+    subjects = merged_data['Subject'].cat
+    lang_codes = subjects.categories.get_indexer(main_languages)
+    mask = np.isin(subjects.codes.to_numpy(), lang_codes[lang_codes >= 0])
+    sub = merged_data[mask].sort_values(['Subject', 'Year'])
+    groups = dict(list(sub.groupby('Subject', sort=False, observed=True)))
     
     # 为每个语言科目绘制趋势线
     for lang in main_languages:
-        lang_data = merged_data[merged_data['Subject'] == lang].sort_values('Year')
-        if not lang_data.empty:
+        lang_data = groups.get(lang)
+        if lang_data is not None:
             if lang == 'ENGLISH':
                 ax.plot(lang_data['Year'], lang_data['Document Count'], 
                        label=lang, linewidth=3, color=COLORS['primary'])
@@ -184,14 +335,30 @@ def create_language_trends_chart(merged_data):
     for spine in ax.spines.values():
         spine.set_color(COLORS['border'])
     
-    plt.tight_layout()
+    fig = ax.figure
+    fig.tight_layout()
     output_path = os.path.join(OUTPUT_DIR, 'language_trends_chart.png')
-    plt.savefig(output_path, dpi=150, bbox_inches='tight',
-                facecolor=COLORS['background'])
-    plt.close()
+    fig.savefig(output_path)
     
     print(f"Language trends chart saved to: {output_path}")
 
+def _match_quotes(buf, limit):
+    """在buf中查找符合条件的句子，只对匹配到的句子解码"""
+    matched = []
+    for m in SENTENCE_PATTERN.finditer(buf):
+        raw = m.group()
+        if b'English' not in raw or b'certificate' not in raw:
+            continue
+        raw = raw.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        sentence = raw.decode('utf-8', 'ignore')
+        if len(sentence) < 200:
+            clean_sentence = sentence.strip()
+            if len(clean_sentence) > 30:
+                matched.append(clean_sentence)
+                if len(matched) >= limit:
+                    break
+    return matched
+
 def extract_quotes():
     """从educationcomms.txt提取相关引文"""
     print("Extracting quotes from historical documents...")
@@ -200,21 +367,19 @@ def extract_quotes():
     
     try:
         file_path = os.path.join(DATA_DIR, 'educationcomms.txt')
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        matched = []
+        # 空文件无法映射，直接视为没有匹配
+        if os.path.getsize(file_path) > 0:
+            with open(file_path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # 找到3条引文后即停止扫描
+                matched = _match_quotes(mm, limit=3)
         
-        # 提取包含"English"和"certificate"的句子（简化版）
-        sentences = content.split('.')
-        for i, sentence in enumerate(sentences[:1000]):  # 只查看前1000句
-            if 'English' in sentence and 'certificate' in sentence and len(sentence) < 200:
-                clean_sentence = sentence.strip()
-                if len(clean_sentence) > 30:
-                    quotes.append({
-                        'text': clean_sentence + '.',
-                        'topic': 'English Requirement'
-                    })
-                    if len(quotes) >= 3:
-                        break
+        for clean_sentence in matched:
+            quotes.append({
+                'text': clean_sentence + '.',
+                'topic': 'English Requirement'
+            })
         
         print(f"Extracted {len(quotes)} quotes")
         
@@ -229,33 +394,42 @@ def extract_quotes():
     
     return quotes
 
-def generate_statistics(doc_timeline, merged_data):
+def generate_statistics(years, counts, merged_data):
     """生成关键统计数据"""
     print("Generating statistics...")
     
     stats = {
-        'total_years': int(doc_timeline['Year'].max() - doc_timeline['Year'].min()),
-        'total_documents': int(doc_timeline['Document Count'].sum()),
-        'war_year_drop': int(doc_timeline[doc_timeline['Year'].between(1939, 1945)]['Document Count'].sum()),
+        'total_years': int(years.max() - years.min()),
+        'total_documents': int(counts.sum()),
+        'war_year_drop': int(counts[(years >= 1939) & (years <= 1945)].sum()),
         'english_dominance': 0,
         'gaelic_presence': 0
     }
     
-    # 计算英语和盖尔语的文档数量
-    english_count = merged_data[merged_data['Subject'] == 'ENGLISH']['Document Count'].sum()
-    gaelic_count = merged_data[merged_data['Subject'].str.contains('GAELIC', na=False)]['Document Count'].sum()
+    # 计算英语和盖尔语的文档数量（一次分组汇总，再在科目索引上筛选）
+    subj_sum = merged_data.groupby('Subject', sort=False, observed=True)['Document Count'].sum()
+    english_count = subj_sum.get('ENGLISH', 0)
+    gaelic_mask = subj_sum.index.str.contains('GAELIC', regex=False)
+    gaelic_count = subj_sum[gaelic_mask].sum()
     
     stats['english_dominance'] = int(english_count)
     stats['gaelic_presence'] = int(gaelic_count)
     
     # 保存为JSON
     output_path = os.path.join(OUTPUT_DIR, 'statistics.json')
-    with open(output_path, 'w') as f:
-        json.dump(stats, f, indent=2)
+    _write_json(output_path, stats)
     
     print(f"Statistics saved to: {output_path}")
     return stats
 
+def _render_chart(chart_func, figsize, *args):
+    """在指定尺寸的新Figure上调用图表函数（供子进程使用）"""
+    fig, ax = plt.subplots(figsize=figsize)
+    try:
+        return chart_func(*args, ax)
+    finally:
+        plt.close(fig)
+
 def main():
     """主函数"""
     print("=" * 50)
@@ -276,36 +450,52 @@ def main():
         print("  └── data/")
         print("      ├── doc_timeline.csv")
         print("      ├── educationcomms.txt")
-        print("      ├── merged_textinfo_by_subject_and_year.csv")
-        print("      └── subject_names.csv")
+        print("      └── merged_textinfo_by_subject_and_year.csv")
+        return
+    
+    # 输入未变化时跳过重新生成
+    manifest = _build_manifest()
+    if _outputs_up_to_date(manifest):
+        print("\nInputs unchanged since last run, outputs are up to date.")
         return
     
     # 加载数据
     try:
-        doc_timeline, subject_names, merged_data = load_data()
+        doc_timeline, merged_data = load_data()
     except FileNotFoundError as e:
         print(f"\nERROR: {e}")
         print("\nPlease make sure all required data files are in the 'data' folder:")
         print("  - doc_timeline.csv")
         print("  - educationcomms.txt")
         print("  - merged_textinfo_by_subject_and_year.csv")
-        print("  - subject_names.csv")
         return
     
+    # 时间线的年份和文档数量只取一次numpy数组，供图表和统计共用
+    years = doc_timeline['Year'].to_numpy()
+    counts = doc_timeline['Document Count'].to_numpy()
+    
     # 生成图表
-    create_timeline_chart(doc_timeline)
-    create_language_subjects_chart(merged_data)
-    create_language_trends_chart(merged_data)
+    # 三张图表互不依赖，在子进程中并行生成
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(_render_chart, create_timeline_chart, (12, 6), years, counts),
+            executor.submit(_render_chart, create_language_subjects_chart, (10, 6), merged_data),
+            executor.submit(_render_chart, create_language_trends_chart, (12, 6), merged_data),
+        ]
+        for future in futures:
+            future.result()
     
     # 提取引文
     quotes = extract_quotes()
     output_path = os.path.join(OUTPUT_DIR, 'quotes.json')
-    with open(output_path, 'w') as f:
-        json.dump(quotes, f, indent=2)
+    _write_json(output_path, quotes)
     print(f"Quotes saved to: {output_path}")
     
     # 生成统计数据
-    stats = generate_statistics(doc_timeline, merged_data)
+    stats = generate_statistics(years, counts, merged_data)
+    
+    # 记录本次运行的输入哈希
+    _write_json(MANIFEST_PATH, manifest)
     
     print("\n" + "=" * 50)
     print("Processing Complete!")
@@ -315,11 +505,8 @@ def main():
     print(f"English Documents: {stats['english_dominance']}")
     print(f"Gaelic Documents: {stats['gaelic_presence']}")
     print("\nGenerated files:")
-    print(f"  - {os.path.join(OUTPUT_DIR, 'timeline_chart.png')}")
-    print(f"  - {os.path.join(OUTPUT_DIR, 'language_subjects_chart.png')}")
-    print(f"  - {os.path.join(OUTPUT_DIR, 'language_trends_chart.png')}")
-    print(f"  - {os.path.join(OUTPUT_DIR, 'statistics.json')}")
-    print(f"  - {os.path.join(OUTPUT_DIR, 'quotes.json')}")
+    for path in OUTPUT_FILES:
+        print(f"  - {path}")
     print("=" * 50)
 
 if __name__ == "__main__":